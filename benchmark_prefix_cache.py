@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------
+# NOTICE: This code is the exclusive property of Cornell University
+#         Computer Architecture Research and is strictly confidential.
+#
+#         Unauthorized distribution, reproduction, or use of this code, in
+#         whole or in part, is strictly prohibited. This includes, but is
+#         not limited to, any form of public or private distribution,
+#         publication, or replication.
+#
+# For inquiries or access requests, please contact:
+#         Zuoming Fu (zf242@cornell.edu)
+# ----------------------------------------------------------------------------
+
+import argparse
+from statistics import median
+from time import perf_counter
+
+import torch
+
+from rag_utils import generator
+from rag_utils import rag
+
+
+CONTEXT = "\n\n".join(
+    ["An agent uses a large language model as its core controller, "
+     "complemented by planning, memory and tool use components."] * 4
+)
+QUESTION = "What is an agent?"
+
+
+def generate(gen, prompt, use_prefix_cache, **kwargs):
+    '''Generate from a prompt greedily, with or without the prefix cache.
+
+    Parameters:
+    gen (SystemSavantModel): The generator to use.
+    prompt (str): The full prompt.
+    use_prefix_cache (bool): Whether to reuse the cached prefix key/values.
+    '''
+
+    gen.use_prefix_cache = use_prefix_cache
+    batch, prefix_entry = gen._prepare_inputs(prompt)
+    if use_prefix_cache and prefix_entry is None:
+        raise RuntimeError("the prompt did not match the cached prefix")
+
+    return gen._generate(batch, prefix_entry, do_sample=False, eos_token_id=None, **kwargs)
+
+
+def check_outputs(gen, prompt, max_new_tokens):
+    '''Check that the cached and uncached paths generate the same tokens.
+
+    Parameters:
+    gen (SystemSavantModel): The generator to check.
+    prompt (str): The full prompt.
+    max_new_tokens (int): The number of tokens to generate.
+    '''
+
+    uncached = generate(gen, prompt, False, max_new_tokens=max_new_tokens)
+    cached = generate(gen, prompt, True, max_new_tokens=max_new_tokens)
+    if not torch.equal(uncached, cached):
+        raise RuntimeError("the prefix cache changed the generated tokens")
+
+
+def time_to_first_token(gen, prompt, use_prefix_cache):
+    '''Time tokenization, cache lookup and prefill (one generated token).
+
+    Parameters:
+    gen (SystemSavantModel): The generator to time.
+    prompt (str): The full prompt.
+    use_prefix_cache (bool): Whether to reuse the cached prefix key/values.
+    '''
+
+    time_start = perf_counter()
+    generate(gen, prompt, use_prefix_cache, max_new_tokens=1)
+    return perf_counter() - time_start
+
+
+def main():
+    '''Measure the prefill time saved per request by the prefix cache.'''
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_name")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--check-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    gen = generator.SystemSavantModel(
+        args.model_name,
+        enable_salesforce_content_safety=False,
+    )
+
+    prefix = rag.CUSTOM_PROMPT_TEMPLATE.split("{context}")[0]
+    prompt = rag.CUSTOM_PROMPT_TEMPLATE.format(context=CONTEXT, question=QUESTION)
+    gen.set_prompt_prefix(prefix)
+
+    # the cached path must generate exactly what the uncached one does, also when
+    # the context starts with a newline that merges with the end of the prefix
+    check_outputs(gen, prompt, args.check_tokens)
+    check_outputs(gen, rag.CUSTOM_PROMPT_TEMPLATE.format(context="\n" + CONTEXT, question=QUESTION),
+                  args.check_tokens)
+
+    # warm up both paths
+    for use_prefix_cache in (False, True, False, True):
+        time_to_first_token(gen, prompt, use_prefix_cache)
+
+    uncached = [time_to_first_token(gen, prompt, False) for _ in range(args.runs)]
+    cached = [time_to_first_token(gen, prompt, True) for _ in range(args.runs)]
+
+    prefix_ids, _ = gen._prefix_caches[prefix]
+    prompt_len = gen._prepare_inputs(prompt)[0]["input_ids"].shape[-1]
+    uncached_ms = median(uncached) * 1000
+    cached_ms = median(cached) * 1000
+
+    print(f"device: {gen._device()}")
+    print(f"outputs: identical for {args.check_tokens} greedy tokens")
+    print(f"prompt tokens: {prompt_len}, cached prefix tokens: {prefix_ids.shape[-1]}")
+    print(f"time to first token (median of {args.runs}): "
+          f"uncached {uncached_ms:.1f} ms, cached {cached_ms:.1f} ms")
+    print(f"prefill saved per request: {uncached_ms - cached_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,10 +17,11 @@
 from langchain_openai import ChatOpenAI
 
 import torch
+from collections import OrderedDict
 from accelerate.utils import is_xpu_available
 from llama_recipes.inference.model_utils import load_model
 from llama_recipes.inference.safety_utils import AgentType, get_safety_checker
-from transformers import AutoTokenizer
+from transformers import AutoTokenizer, DynamicCache
 from langchain_core.messages.ai import AIMessage
 import transformers
 
@@ -80,6 +81,8 @@ class SystemSavantModel:
         max_padding_length: int = None,  # Max padding length for tokenizer
         use_fast_kernels: bool = False,  # Enable SDPA for memory-efficient kernels
         share_gradio: bool = False,  # Enable Gradio sharing
+        use_prefix_cache: bool = True,  # Reuse the key/values of a fixed prompt prefix across requests
+        max_prefix_caches: int = 4,  # The maximum number of prompt prefixes to keep key/values for
         **kwargs,
     ):
         # Store the provided arguments as attributes
@@ -104,8 +107,14 @@ class SystemSavantModel:
         self.max_padding_length = max_padding_length
         self.use_fast_kernels = use_fast_kernels
         self.share_gradio = share_gradio
+        self.use_prefix_cache = use_prefix_cache
+        self.max_prefix_caches = max_prefix_caches
         self.kwargs = kwargs
 
+        # The prompt prefix caches: prefix -> (input ids, key/values) or None until built,
+        # ordered from least to most recently used
+        self._prefix_caches = OrderedDict()
+
         # Setup the model and tokenizer
         self._setup_seed()
         self.model = self._load_model()
@@ -124,6 +133,144 @@ class SystemSavantModel:
             self.model_name, self.quantization, self.use_fast_kernels, **self.kwargs
         )
 
+    def _device(self):
+        if is_xpu_available():
+            return "xpu"
+        elif torch.cuda.is_available():
+            return "cuda"
+        return "cpu"
+
+    def set_prompt_prefix(self, prefix):
+        '''Register a fixed prompt prefix whose key/values are reused across requests.
+
+        Caches are kept per prefix string, so several prompt templates can share
+        one generator. At most max_prefix_caches prefixes are kept; registering
+        or using a prefix marks it as most recently used, and the least recently
+        used one is dropped when the limit is exceeded. A template that is no
+        longer used can be dropped right away with clear_prompt_prefix(). A None
+        prefix (e.g. a hub prompt with no known template) is ignored.
+
+        Parameters:
+        prefix (str): The prefix shared by every prompt of a template.
+        '''
+
+        if not prefix:
+            return
+
+        if prefix in self._prefix_caches:
+            self._prefix_caches.move_to_end(prefix)
+        else:
+            self._prefix_caches[prefix] = None  # built lazily on first use
+
+        while len(self._prefix_caches) > self.max_prefix_caches:
+            self._prefix_caches.popitem(last=False)
+
+    def clear_prompt_prefix(self, prefix=None):
+        '''Drop the cached key/values of a prompt prefix.
+
+        Parameters:
+        prefix (str): The prefix to drop, or None to drop all of them.
+        '''
+
+        if prefix is None:
+            self._prefix_caches.clear()
+        else:
+            self._prefix_caches.pop(prefix, None)
+
+    def _build_prefix_cache(self, prefix):
+        '''Tokenize a prompt prefix and precompute its key/values.
+
+        Parameters:
+        prefix (str): The registered prefix to build the cache for.
+        '''
+
+        ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"]
+        ids = ids.to(self._device())
+
+        # the last prefix token may merge with the text that follows it
+        # (e.g. ":\n" + "\n" -> ":\n\n"), so leave it out of the cache
+        if ids.shape[-1] > 1:
+            ids = ids[:, :-1]
+
+        with torch.no_grad():
+            outputs = self.model(input_ids=ids, use_cache=True)
+
+        cache = outputs.past_key_values
+        if isinstance(cache, tuple):
+            cache = DynamicCache.from_legacy_cache(cache)
+
+        print(f"[debug] cached prompt prefix: {ids.shape[-1]} tokens")
+        self._prefix_caches[prefix] = (ids, cache)
+        return ids, cache
+
+    def _prepare_inputs(self, user_prompt):
+        '''Tokenize a prompt and look up the cached key/values of its prefix.
+
+        The full prompt is always tokenized, so the model sees exactly the same
+        input ids with or without the cache; the cache is only used when its
+        tokens match the start of those ids.
+
+        Parameters:
+        user_prompt (str): The prompt to tokenize.
+        '''
+
+        batch = self.tokenizer(
+            user_prompt,
+            truncation=True,
+            max_length=self.max_padding_length,
+            return_tensors="pt",
+        )
+        batch = {k: v.to(self._device()) for k, v in batch.items()}
+
+        # beam search and multiple return sequences reorder or expand the cache
+        if not (self.use_prefix_cache and self.use_cache) \
+                or self.kwargs.get("num_beams", 1) > 1 \
+                or self.kwargs.get("num_return_sequences", 1) > 1:
+            return batch, None
+
+        prefixes = [p for p in self._prefix_caches if user_prompt.startswith(p)]
+        if not prefixes:
+            return batch, None
+
+        prefix = max(prefixes, key=len)
+        self._prefix_caches.move_to_end(prefix)
+        entry = self._prefix_caches[prefix]
+        if entry is None:
+            entry = self._build_prefix_cache(prefix)
+
+        # the cache is only valid if the full prompt tokenizes to the same
+        # prefix ids, and at least one token must be left for generate() to prefill
+        prefix_ids = entry[0]
+        input_ids = batch["input_ids"]
+        n_prefix = prefix_ids.shape[-1]
+        if input_ids.shape[-1] <= n_prefix or not torch.equal(input_ids[:, :n_prefix], prefix_ids):
+            return batch, None
+
+        return batch, entry
+
+    def _generate(self, batch, prefix_entry, **kwargs):
+        '''Run generate(), starting from the cached prefix key/values if given.
+
+        Parameters:
+        batch (dict): The tokenized prompt.
+        prefix_entry (tuple): The (input ids, key/values) of the prompt prefix, or None.
+        '''
+
+        if prefix_entry is None:
+            with torch.no_grad():
+                return self.model.generate(**batch, **kwargs)
+
+        prefix_ids, cache = prefix_entry
+        try:
+            with torch.no_grad():
+                return self.model.generate(**batch, past_key_values=cache, **kwargs)
+        finally:
+            # generate() extends the shared cache in place, so cut it back to the prefix
+            # (a negative crop removes tokens from the end on every transformers version)
+            n_extra = cache.get_seq_length() - prefix_ids.shape[-1]
+            if n_extra > 0:
+                cache.crop(-n_extra)
+
     def gen_resp(self, user_prompt, temperature=1.0, top_p=1.0, top_k=50, max_new_tokens=200):
 
         if not isinstance(user_prompt, str):
@@ -143,33 +290,23 @@ class SystemSavantModel:
             return
 
 
-        batch = self.tokenizer(
-            user_prompt,
-            truncation=True,
-            max_length=self.max_padding_length,
-            return_tensors="pt",
-        )
+        batch, prefix_entry = self._prepare_inputs(user_prompt)
 
-        if is_xpu_available():
-            batch = {k: v.to("xpu") for k, v in batch.items()}
-        else:
-            batch = {k: v.to("cuda") for k, v in batch.items()}
-
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **batch,
-                max_new_tokens=max_new_tokens,  # Use the dynamic value passed from Gradio
-                do_sample=self.do_sample,
-                top_p=top_p,  # Use the dynamic value passed from Gradio
-                temperature=temperature,  # Use the dynamic value passed from Gradio
-                min_length=self.min_length,
-                use_cache=self.use_cache,
-                top_k=top_k,  # Use the dynamic value passed from Gradio
-                repetition_penalty=self.repetition_penalty,
-                length_penalty=self.length_penalty,
-                eos_token_id=128009,
-                **self.kwargs,
-            )
+        outputs = self._generate(
+            batch,
+            prefix_entry,
+            max_new_tokens=max_new_tokens,  # Use the dynamic value passed from Gradio
+            do_sample=self.do_sample,
+            top_p=top_p,  # Use the dynamic value passed from Gradio
+            temperature=temperature,  # Use the dynamic value passed from Gradio
+            min_length=self.min_length,
+            use_cache=self.use_cache,
+            top_k=top_k,  # Use the dynamic value passed from Gradio
+            repetition_penalty=self.repetition_penalty,
+            length_penalty=self.length_penalty,
+            eos_token_id=128009,
+            **self.kwargs,
+        )
 
 
         output_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
@@ -23,6 +23,16 @@ from rag_utils.generator import *
 from rag_utils.retriever import *
 from time import time
 
+CUSTOM_PROMPT_TEMPLATE = \
+    "User:\n" + \
+    "Use the following pieces of context to answer the question at the end." + \
+    "If you don't know the answer, just say that you don't know, don't try to make up an answer." + \
+    "Use three sentences maximum and keep the answer as concise as possible." + \
+    "Always say \"thanks for asking!\" at the end of the answer.\n" + \
+    "Context:\n{context}\n" + \
+    "Question:\n{question}\n" + \
+    "Answer:"
+
 class RAG:
 
     def __init__(
@@ -32,6 +42,9 @@ class RAG:
         prompt_src="rlm/rag-prompt",
         cache_dir="",
     ):
+        # the prompt template (only known for the custom prompt)
+        self.template = None
+
         # the retriever and generator
         self.retriever = retriever
         self.generator = generator
@@ -42,9 +55,9 @@ class RAG:
         else:
             self.prompt = hub.pull(prompt_src)
         self.rag_chain = self._get_chain()
+        self._set_generator_prefix()
 
         # the rag chain trace
-        self.template = None
         self.trace_retrieved_docs = None
         self.trace_prompted_docs = None
 
@@ -61,19 +74,19 @@ class RAG:
     def _custom_prompt(self):
         '''Create a custom RAG prompt.'''
 
-        self.template = \
-            "User:\n" + \
-            "Use the following pieces of context to answer the question at the end." + \
-            "If you don't know the answer, just say that you don't know, don't try to make up an answer." + \
-            "Use three sentences maximum and keep the answer as concise as possible." + \
-            "Always say \"thanks for asking!\" at the end of the answer.\n" + \
-            "Context:\n{context}\n" + \
-            "Question:\n{question}\n" + \
-            "Answer:"
+        self.template = CUSTOM_PROMPT_TEMPLATE
 
         custom_rag_prompt = PromptTemplate.from_template(self.template)
         return custom_rag_prompt
 
+    def _set_generator_prefix(self):
+        '''Share the fixed template prefix with generators that can cache it.'''
+
+        if self.template is None or not hasattr(self.generator, "set_prompt_prefix"):
+            return
+
+        self.generator.set_prompt_prefix(self.template.split("{context}")[0])
+
     def _get_chain(self):
         '''Get the RAG chain.'''
         